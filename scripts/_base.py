@@ -0,0 +1,1266 @@
+import argparse
+import asyncio
+import email.utils
+import gzip
+import hashlib
+import importlib.util
+import json as stdlib_json
+import logging
+import logging.handlers
+import os
+import random
+import re
+import signal
+import stat
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import cached_property, partial
+from types import MappingProxyType, TracebackType
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Coroutine, Deque, Dict, Mapping, Sequence, TypeVar, Union
+
+import aiohttp
+from aiohttp.abc import AbstractResolver
+from yarl import URL
+
+try:
+    import aiodns  # noqa: F401 - only needed by aiohttp.AsyncResolver
+    HAS_AIODNS: bool = True
+except ImportError:
+    HAS_AIODNS = False
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+HAS_ORJSON: bool = orjson is not None
+
+try:
+    # uvloop is never installed on Windows, even with the fast extra
+    import uvloop  # pyright: ignore[reportMissingImports]
+except ImportError:
+    uvloop = None
+HAS_UVLOOP: bool = uvloop is not None and sys.platform != 'win32'
+
+# The HTTP/2 backend lives in _http2 and is only imported when --http2 asks
+# for it, so httpx is never loaded otherwise
+HAS_HTTPX: bool = all(importlib.util.find_spec(name) is not None for name in ('httpx', 'h2'))
+if TYPE_CHECKING:
+    from _http2 import Http2Session
+
+T = TypeVar('T')
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Construct logs directory path relative to the project root (parent of scripts/)
+SCRIPT_DIR: str = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR: str = os.path.dirname(SCRIPT_DIR)
+LOGS_DIR: str = os.path.join(PROJECT_DIR, 'logs')
+LOG_FORMAT: str = '%(asctime)s - %(levelname)s - %(message)s'
+# Log records are buffered unformatted and written out in batches; under
+# sustained overload the oldest are dropped rather than blocking callers
+LOG_BUFFER_SIZE: int = 10_000
+LOG_FLUSH_INTERVAL: float = 0.5
+# Each pipe appends to one log file, rotated once it reaches LOG_MAX_BYTES
+LOG_MAX_BYTES: int = 10_000_000
+LOG_BACKUP_COUNT: int = 5
+
+# On-disk response cache, keyed on the SHA-256 of the submitted text
+CACHE_DIR: str = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+    'talos-ai-detect'
+)
+CACHE_TTL_SECONDS: float = 7 * 24 * 60 * 60
+CACHE_MAX_TEXT_BYTES: int = 1024 * 1024
+CACHE_MODES: tuple[str, ...] = ('readWrite', 'readOnly', 'writeOnly', 'off')
+
+# Only these are worth retrying; any other 4xx means the request itself is bad
+RETRY_STATUSES: frozenset[int] = frozenset({429, 502, 503, 504})
+MAX_RETRIES: int = 3
+BACKOFF_BASE: float = 0.5
+BACKOFF_CAP: float = 10.0
+
+# Per-attempt timeouts, and the overall budget for an attempt plus its retries;
+# a retry that could not get MIN_ATTEMPT_SECONDS of that budget is not started
+TIMEOUT: aiohttp.ClientTimeout = aiohttp.ClientTimeout(total=30, connect=5, sock_connect=5, sock_read=25)
+RETRY_DEADLINE: float = 60.0
+MIN_ATTEMPT_SECONDS: float = 1.0
+
+# Request bodies larger than this are gzip-compressed; a host that answers a
+# compressed body with one of GZIP_REJECT_STATUSES gets plain bodies from then
+# on. Only 415 says the encoding itself was refused: a 400 or 422 is a real
+# validation error and is raised like any other.
+GZIP_MIN_BYTES: int = 1024
+GZIP_REJECT_STATUSES: frozenset[int] = frozenset({415})
+
+# Pause new requests to a host once its reported budget drops this low
+RATE_LIMIT_LOW_WATERMARK: int = 2
+# Hard cap on in-flight requests per host, whatever the AIMD limit says
+BULKHEAD_SIZE: int = 16
+# AIMD concurrency control: grow by CONCURRENCY_STEP after a window of
+# LATENCY_WINDOW fast responses, halve on errors or a slow window. The limit
+# never grows past the bulkhead, where extra slots would do nothing.
+INITIAL_CONCURRENCY: int = 8
+MIN_CONCURRENCY: int = 1
+MAX_CONCURRENCY: int = BULKHEAD_SIZE
+CONCURRENCY_STEP: float = 0.5
+LATENCY_WINDOW: int = 20
+TARGET_LATENCY: float = 1.5
+
+# Open a host's circuit after this many consecutive failures, then allow a
+# single probe request once CIRCUIT_RECOVERY_SECONDS have passed
+CIRCUIT_ERROR_THRESHOLD: int = 5
+CIRCUIT_RECOVERY_SECONDS: float = 30.0
+
+class RingBufferHandler(logging.Handler):
+    """
+    Buffer log records and write them to target from a background thread
+
+    emit() only appends the record to a bounded deque; formatting and file
+    I/O happen when the buffer is drained, every interval seconds, on flush()
+    and on close().
+    """
+
+    def __init__(
+        self,
+        target: logging.Handler,
+        capacity: int = LOG_BUFFER_SIZE,
+        interval: float = LOG_FLUSH_INTERVAL
+    ) -> None:
+        super().__init__()
+        self.target: logging.Handler = target
+        self.interval: float = interval
+        self._buffer: Deque[logging.LogRecord] = deque(maxlen=capacity)
+        self._drain_lock: threading.Lock = threading.Lock()
+        self._stopped: threading.Event = threading.Event()
+        self._thread: threading.Thread = threading.Thread(target=self._run, name='log-flush', daemon=True)
+        self._thread.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self._buffer.append(record)
+
+    def _drain(self) -> None:
+        with self._drain_lock:
+            while self._buffer:
+                self.target.handle(self._buffer.popleft())
+            self.target.flush()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self._drain()
+
+    def flush(self) -> None:
+        self._drain()
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+        self._drain()
+        self.target.close()
+        super().close()
+
+class LazyRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler that creates its directory and file on first write
+
+    Runs that never log anything, such as empty-input health checks, leave
+    the filesystem untouched.
+    """
+
+    def __init__(self, filename: str, maxBytes: int = 0, backupCount: int = 0) -> None:
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, delay=True)
+
+    def _open(self) -> Any:
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+def _exit_on_sigterm(signum: int, frame: Any) -> None:
+    # Unwind normally so finally blocks and logging.shutdown() flush the logs
+    raise SystemExit(128 + signum)
+
+def configure_logging(log_filename: str, level: int = logging.INFO) -> Union[RingBufferHandler, None]:
+    """
+    Send root logging to a rotating log_filename through a RingBufferHandler
+
+    Logging calls only append to an in-memory buffer, so formatting and file
+    writes never run on the event loop, and the file (and its directory) is
+    only created once something is logged. logging.shutdown() flushes the buffer
+    at exit, and SIGTERM is turned into a normal exit so that happens then
+    too. Like logging.basicConfig, this does nothing if the root logger is
+    already configured.
+
+    Args:
+        log_filename (str): File to append log records to
+        level (int): Root logger level
+
+    Returns:
+        RingBufferHandler: The installed handler, or None if logging was
+            already configured
+    """
+    root: logging.Logger = logging.getLogger()
+    if root.handlers:
+        return None
+    file_handler: LazyRotatingFileHandler = LazyRotatingFileHandler(
+        log_filename,
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT
+    )
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler: RingBufferHandler = RingBufferHandler(file_handler)
+    root.addHandler(handler)
+    root.setLevel(level)
+    if threading.current_thread() is threading.main_thread() and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    return handler
+
+@dataclass(frozen=True)
+class ProviderSpec:
+    """Everything that differs between the AI detection APIs"""
+
+    # Short identifier used in log file and cache directory names
+    name: str
+    # Human-readable name used in log messages and --help
+    display_name: str
+    url: str
+    api_key_env: str
+    headers_fn: Callable[[str], Dict[str, str]]
+    payload_fn: Callable[[str], Dict[str, Any]]
+    # Send large bodies with Content-Encoding: gzip (falls back if refused)
+    compress_requests: bool = False
+    # Read from api_key_env once, when the spec is created, unless given
+    api_key: Union[str, None] = field(default=None, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.api_key is None:
+            object.__setattr__(self, 'api_key', os.environ.get(self.api_key_env))
+
+    @cached_property
+    def headers(self) -> Mapping[str, str]:
+        """Request headers, built once and shared by every call"""
+        if not self.api_key:
+            raise ProviderError(f"{self.api_key_env} environment variable not set")
+        return MappingProxyType(self.headers_fn(self.api_key))
+
+class ProviderError(Exception):
+    """A provider call failed; the message is what the pipe reports"""
+
+def json_dumps(obj: Any, indent: bool = False) -> bytes:
+    """Serialize obj to UTF-8 JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else None)
+    return stdlib_json.dumps(obj, indent=2 if indent else None, ensure_ascii=False).encode()
+
+def json_loads(data: Union[bytes, str]) -> Any:
+    """Parse JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return stdlib_json.loads(data)
+
+def build_arg_parser(description: str) -> argparse.ArgumentParser:
+    """Return an ArgumentParser with the options shared by every pipe"""
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--pretty', action='store_true',
+                        help='re-indent the JSON response instead of passing it through as received')
+    parser.add_argument('--cache', choices=CACHE_MODES, default='readWrite',
+                        help=f'use the response cache in {CACHE_DIR} (default: %(default)s)')
+    parser.add_argument('--http2', action='store_true',
+                        help='send requests over HTTP/2 with httpx (needs the http2 extra)')
+    parser.add_argument('--jsonl', action='store_true',
+                        help='read one document per line, each a JSON string or {"text": ...} object, '
+                             'and print one JSON result per line')
+    return parser
+
+async def read_stdin() -> str:
+    """
+    Read all of stdin without blocking the event loop
+
+    Pipes and sockets are read through loop.connect_read_pipe so other tasks
+    (such as warmup) run while input streams in. Anything else, including
+    regular files, terminals and stdin replacements without a usable
+    descriptor, is read on a worker thread instead.
+
+    Returns:
+        str: Everything read from stdin
+    """
+    encoding: str = getattr(sys.stdin, 'encoding', None) or 'utf-8'
+    try:
+        fd: int = sys.stdin.fileno()
+        mode: int = os.fstat(fd).st_mode
+    except (AttributeError, OSError, ValueError):
+        return await asyncio.to_thread(sys.stdin.read)
+    # Character devices are left to the thread too: some, like /dev/null,
+    # cannot be registered with epoll at all
+    if sys.platform == 'win32' or not (stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode)):
+        return await asyncio.to_thread(sys.stdin.read)
+
+    # Read from a duplicate so closing the transport leaves sys.stdin open
+    pipe = os.fdopen(os.dup(fd), 'rb', buffering=0)
+    reader: asyncio.StreamReader = asyncio.StreamReader()
+    transport, _ = await asyncio.get_running_loop().connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), pipe
+    )
+    try:
+        data: bytes = await reader.read()
+    finally:
+        transport.close()
+    return data.decode(encoding)
+
+def write_output(result: str, pretty: bool = False) -> None:
+    """
+    Write a pipe result to stdout as bytes
+
+    Args:
+        result (str): API response or error message
+        pretty (bool): Re-indent result if it is JSON
+    """
+    data: bytes = result.encode()
+    if pretty:
+        try:
+            data = json_dumps(json_loads(data), indent=True)
+        except ValueError:
+            # Error messages are plain text; print them unchanged
+            pass
+    sys.stdout.flush()
+    sys.stdout.buffer.write(data + b'\n')
+    sys.stdout.buffer.flush()
+
+class ResponseCache:
+    """On-disk cache of successful API responses for one provider"""
+
+    def __init__(
+        self,
+        provider: str,
+        mode: str = 'readWrite',
+        ttl: float = CACHE_TTL_SECONDS,
+        directory: str = CACHE_DIR
+    ) -> None:
+        if mode not in CACHE_MODES:
+            raise ValueError(f"cache mode must be one of {', '.join(CACHE_MODES)}, not {mode!r}")
+        self.mode: str = mode
+        self.ttl: float = ttl
+        self.directory: str = os.path.join(directory, provider)
+
+    def _path(self, text: str) -> Union[str, None]:
+        # Empty and very large documents are never cached
+        data: bytes = text.encode()
+        if not data or len(data) > CACHE_MAX_TEXT_BYTES:
+            return None
+        return os.path.join(self.directory, f'{hashlib.sha256(data).hexdigest()}.json')
+
+    def get(self, text: str) -> Union[bytes, None]:
+        """
+        Return the cached response for text, if present and fresh
+
+        Args:
+            text (str): Submitted document
+
+        Returns:
+            bytes: Cached response body, or None on a miss
+        """
+        if self.mode not in ('readWrite', 'readOnly'):
+            return None
+        path: Union[str, None] = self._path(text)
+        if path is None:
+            return None
+        try:
+            if time.time() - os.path.getmtime(path) >= self.ttl:
+                return None
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, text: str, body: bytes) -> None:
+        """
+        Store a successful response for text
+
+        The file is written under a temporary name and renamed into place, so
+        concurrent readers and writers never see a partial entry.
+
+        Args:
+            text (str): Submitted document
+            body (bytes): Response body to cache
+        """
+        if self.mode not in ('readWrite', 'writeOnly'):
+            return
+        path: Union[str, None] = self._path(text)
+        if path is None:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(body)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logger.warning("Could not write response cache entry %s: %s", path, e)
+
+class ConcurrencyLimiter:
+    """Semaphore whose limit adapts to observed latency and errors (AIMD)"""
+
+    def __init__(
+        self,
+        limit: float = INITIAL_CONCURRENCY,
+        minimum: float = MIN_CONCURRENCY,
+        maximum: float = MAX_CONCURRENCY
+    ) -> None:
+        self.limit: float = limit
+        self.minimum: float = minimum
+        self.maximum: float = maximum
+        self._in_flight: int = 0
+        self._waiters: Deque[asyncio.Future[None]] = deque()
+        self._latencies: list[float] = []
+
+    @property
+    def slots(self) -> int:
+        return max(1, int(self.limit))
+
+    async def acquire(self) -> None:
+        while self._in_flight >= self.slots:
+            waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Pass a wakeup we were handed on to the next waiter
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self._in_flight += 1
+
+    def release(self) -> None:
+        self._in_flight -= 1
+        self._wake()
+
+    def decrease(self, factor: float = 0.5) -> None:
+        """Multiplicatively shrink the limit, never below the minimum"""
+        self.limit = max(self.minimum, self.limit * factor)
+        self._latencies.clear()
+
+    def increase(self, step: float = CONCURRENCY_STEP) -> None:
+        """Additively grow the limit, never above the maximum"""
+        self.limit = min(self.maximum, self.limit + step)
+        self._wake()
+
+    def record_latency(self, seconds: float) -> None:
+        """
+        Add a successful request's latency to the sliding window
+
+        Each full window of LATENCY_WINDOW samples grows the limit if its
+        average is within TARGET_LATENCY and halves it otherwise.
+        """
+        self._latencies.append(seconds)
+        if len(self._latencies) < LATENCY_WINDOW:
+            return
+        average: float = sum(self._latencies) / len(self._latencies)
+        self._latencies.clear()
+        if average <= TARGET_LATENCY:
+            self.increase()
+        else:
+            self.decrease()
+
+    def _wake(self) -> None:
+        free: int = self.slots - self._in_flight
+        while free > 0 and self._waiters:
+            waiter: asyncio.Future[None] = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(
+        self,
+        exc_type: Union[type[BaseException], None],
+        exc: Union[BaseException, None],
+        tb: Union[TracebackType, None]
+    ) -> None:
+        self.release()
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS: Dict[str, float] = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+
+def _parse_duration(value: str) -> Union[float, None]:
+    # Accepts plain seconds ("1.5") or Go-style durations ("6m0s", "20ms")
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts: list[tuple[str, str]] = _DURATION_PART.findall(value)
+    if not parts or ''.join(n + u for n, u in parts) != value.strip():
+        return None
+    return sum(float(n) * _DURATION_UNITS[u] for n, u in parts)
+
+@dataclass
+class RateLimitState:
+    """Request budget and concurrency limit for one API host"""
+
+    remaining: int = -1
+    reset_at: float = 0.0
+    limiter: ConcurrencyLimiter = field(default_factory=ConcurrencyLimiter)
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        """Record the budget reported by x-ratelimit-* / Retry-After headers"""
+        now: float = time.monotonic()
+        remaining: Union[str, None] = headers.get('x-ratelimit-remaining-requests')
+        if remaining is not None:
+            try:
+                self.remaining = int(remaining)
+            except ValueError:
+                pass
+        reset: Union[str, None] = headers.get('x-ratelimit-reset-requests')
+        reset_after: Union[float, None] = _parse_duration(reset) if reset is not None else None
+        if reset_after is not None:
+            self.reset_at = now + reset_after
+        retry_after: Union[float, None] = _retry_after(headers)
+        if retry_after is not None:
+            self.remaining = 0
+            self.reset_at = max(self.reset_at, now + retry_after)
+
+    def pause(self) -> float:
+        """Return how long wait() would sleep right now"""
+        if 0 <= self.remaining <= RATE_LIMIT_LOW_WATERMARK:
+            return max(0.0, self.reset_at - time.monotonic())
+        return 0.0
+
+    async def wait(self) -> None:
+        """Sleep until the budget resets if it is nearly used up"""
+        if 0 <= self.remaining <= RATE_LIMIT_LOW_WATERMARK:
+            delay: float = self.pause()
+            if delay > 0:
+                logger.info("Rate limit budget at %d, pausing %.2fs", self.remaining, delay)
+                await asyncio.sleep(delay)
+            self.remaining = -1
+
+class CircuitOpenError(aiohttp.ClientError):
+    """Raised instead of sending a request to a host whose circuit is open"""
+
+class RetryDeadlineError(aiohttp.ClientError):
+    """Raised when the retry deadline leaves no time for another attempt"""
+
+class CircuitBreaker:
+    """CLOSED -> OPEN -> HALF_OPEN circuit breaker for one API host"""
+
+    CLOSED: str = 'closed'
+    OPEN: str = 'open'
+    HALF_OPEN: str = 'half_open'
+
+    def __init__(
+        self,
+        host: str,
+        error_threshold: int = CIRCUIT_ERROR_THRESHOLD,
+        recovery_seconds: float = CIRCUIT_RECOVERY_SECONDS
+    ) -> None:
+        self.host: str = host
+        self.error_threshold: int = error_threshold
+        self.recovery_seconds: float = recovery_seconds
+        self.state: str = self.CLOSED
+        self.failures: int = 0
+        self.last_error: str = ''
+        self._opened_at: float = 0.0
+        self._probing: bool = False
+        self._probe_done: asyncio.Event = asyncio.Event()
+
+    def is_open(self) -> bool:
+        """Return True if before_request() would refuse a request right now"""
+        if self.state == self.OPEN:
+            return time.monotonic() - self._opened_at < self.recovery_seconds
+        return self.state == self.HALF_OPEN and self._probing
+
+    def open_error(self) -> CircuitOpenError:
+        return CircuitOpenError(f"{self.host} circuit {self.state.replace('_', '-')}; last error: {self.last_error}")
+
+    async def wait(self, budget: float) -> None:
+        """
+        Wait until before_request() would let a request through
+
+        Sleeps out the rest of an open circuit's recovery_seconds, then waits
+        for the half-open probe to finish, as long as that fits in budget.
+
+        Args:
+            budget (float): Seconds the caller can afford to wait
+
+        Raises:
+            CircuitOpenError: If the circuit will not let a request through
+                within budget
+        """
+        give_up_at: float = time.monotonic() + budget
+        while self.is_open():
+            left: float = give_up_at - time.monotonic()
+            if self.state == self.OPEN:
+                reopens_in: float = self._opened_at + self.recovery_seconds - time.monotonic()
+                if reopens_in > left:
+                    raise self.open_error()
+                await asyncio.sleep(reopens_in)
+                continue
+            try:
+                await asyncio.wait_for(self._probe_done.wait(), max(0.0, left))
+            except asyncio.TimeoutError:
+                raise self.open_error() from None
+
+    def _end_probe(self) -> None:
+        self._probing = False
+        self._probe_done.set()
+
+    def before_request(self) -> None:
+        """
+        Fail fast if the circuit is open
+
+        Once recovery_seconds have passed the circuit goes half-open and lets
+        exactly one probe request through.
+
+        Raises:
+            CircuitOpenError: If the request must not be sent
+        """
+        if self.is_open():
+            raise self.open_error()
+        if self.state == self.OPEN:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            self._probing = True
+            self._probe_done.clear()
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._end_probe()
+
+    def record_failure(self, error: str) -> None:
+        self.last_error = error
+        self.failures += 1
+        self._end_probe()
+        if self.state == self.HALF_OPEN or self.failures >= self.error_threshold:
+            if self.state != self.OPEN:
+                logger.warning("%s circuit opened after %d failures: %s", self.host, self.failures, error)
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def release_probe(self) -> None:
+        """Let another probe through if this one ended without an outcome"""
+        if self._probing:
+            self._end_probe()
+
+# Per-host state, reset along with the shared session since the asyncio
+# primitives in it belong to the session's event loop
+_rate_limits: Dict[str, RateLimitState] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+_bulkheads: Dict[str, asyncio.Semaphore] = {}
+_gzip_rejected: set[str] = set()
+
+def _host(url: str) -> str:
+    return URL(url).host or url
+
+def rate_limit_state(url: str) -> RateLimitState:
+    """Return the RateLimitState for the host of url"""
+    host: str = _host(url)
+    state: Union[RateLimitState, None] = _rate_limits.get(host)
+    if state is None:
+        state = _rate_limits[host] = RateLimitState()
+    return state
+
+def circuit_breaker(url: str) -> CircuitBreaker:
+    """Return the CircuitBreaker for the host of url"""
+    host: str = _host(url)
+    breaker: Union[CircuitBreaker, None] = _breakers.get(host)
+    if breaker is None:
+        breaker = _breakers[host] = CircuitBreaker(host)
+    return breaker
+
+def _bulkhead(url: str) -> asyncio.Semaphore:
+    host: str = _host(url)
+    bulkhead: Union[asyncio.Semaphore, None] = _bulkheads.get(host)
+    if bulkhead is None:
+        bulkhead = _bulkheads[host] = asyncio.Semaphore(BULKHEAD_SIZE)
+    return bulkhead
+
+def _reset_host_state() -> None:
+    _rate_limits.clear()
+    _breakers.clear()
+    _bulkheads.clear()
+    _gzip_rejected.clear()
+
+HTTPSession = Union[aiohttp.ClientSession, 'Http2Session']
+
+# Process-wide HTTP session shared by every pipe, so keep-alive connections
+# (and the connector's DNS cache) survive across calls instead of paying a
+# fresh TCP + TLS handshake per request.
+_session: Union[HTTPSession, None] = None
+_session_loop: Union[asyncio.AbstractEventLoop, None] = None
+# A resolver passed to TCPConnector is not closed with it, so close_session()
+# closes this one itself; otherwise pending lookups outlive the loop
+_resolver: Union[AbstractResolver, None] = None
+
+def _make_connector(resolver: Union[AbstractResolver, None]) -> aiohttp.TCPConnector:
+    # Keep DNS answers cached for the life of the connector
+    return aiohttp.TCPConnector(
+        resolver=resolver,
+        limit=100,
+        limit_per_host=32,
+        use_dns_cache=True,
+        ttl_dns_cache=600,
+        keepalive_timeout=75
+    )
+
+def _json_serialize(obj: Any) -> str:
+    # Used by aiohttp for any json= body, so those go through orjson too
+    return json_dumps(obj).decode()
+
+def get_session(http2: Union[bool, None] = None) -> HTTPSession:
+    """
+    Return the shared ClientSession, creating it on first use
+
+    A session is bound to the event loop it was created on, so a new one is
+    made if the previous session was closed or belongs to another loop.
+    Passing http2 also replaces a shared session of the other kind. Nothing
+    closes the session at exit: callers outside the pipe entrypoints must
+    await close_session() before their event loop closes.
+
+    Args:
+        http2 (bool, optional): Use an Http2Session instead of an aiohttp
+            ClientSession; by default whichever is open is reused, and a new
+            session is an aiohttp one
+
+    Returns:
+        HTTPSession: Session for the running event loop
+    """
+    global _session, _session_loop, _resolver
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    if (
+        _session is not None and not _session.closed and _session_loop is loop
+        and http2 is not None and isinstance(_session, aiohttp.ClientSession) == http2
+    ):
+        loop.create_task(_close(_session, _resolver))
+        _session = None
+        _resolver = None
+    if _session is None or _session.closed or _session_loop is not loop:
+        if http2:
+            from _http2 import Http2Session
+            _session = Http2Session()
+        else:
+            # Resolve with aiodns when available instead of getaddrinfo on
+            # the executor
+            _resolver = aiohttp.AsyncResolver() if HAS_AIODNS else None
+            _session = aiohttp.ClientSession(
+                connector=_make_connector(_resolver),
+                json_serialize=_json_serialize
+            )
+        _session_loop = loop
+        _reset_host_state()
+    return _session
+
+async def _close(session: Union[HTTPSession, None], resolver: Union[AbstractResolver, None]) -> None:
+    if session is not None and not session.closed:
+        await session.close()
+    if resolver is not None:
+        await resolver.close()
+
+async def close_session() -> None:
+    """Close the shared ClientSession if one is open"""
+    global _session, _session_loop, _resolver
+    session: Union[HTTPSession, None] = _session
+    resolver: Union[AbstractResolver, None] = _resolver
+    _session = None
+    _session_loop = None
+    _resolver = None
+    _reset_host_state()
+    await _close(session, resolver)
+
+async def warmup(session: HTTPSession, url: str) -> None:
+    """
+    Pre-resolve DNS and open a pooled connection to the host of url
+
+    Issues a HEAD to the origin and ignores the outcome; any failure is left
+    for the real request to report.
+
+    Args:
+        session (HTTPSession): Session whose pool should be warmed
+        url (str): Any URL on the API host
+    """
+    try:
+        async with session.head(
+            URL(url).origin(),
+            allow_redirects=False,
+            timeout=aiohttp.ClientTimeout(total=5)
+        ):
+            pass
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        pass
+
+def _retry_after(headers: Mapping[str, str]) -> Union[float, None]:
+    # Retry-After is either delta-seconds or an HTTP-date
+    value: Union[str, None] = headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when: datetime = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+def _backoff(attempt: int) -> float:
+    # Exponential backoff with full jitter
+    return random.random() * min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)
+
+async def post_with_retry(
+    session: HTTPSession,
+    url: str,
+    headers: Mapping[str, str],
+    json: Any,
+    max_retries: int = MAX_RETRIES,
+    deadline: float = RETRY_DEADLINE,
+    compress: bool = False
+) -> bytes:
+    """
+    POST json to url, retrying only transient failures
+
+    HTTP 429/502/503/504, dropped connections and timeouts are retried up to
+    max_retries times, waiting for Retry-After when the server sends one and
+    a full-jitter exponential backoff otherwise. Anything else is raised
+    straight away. Requests to a host pause while its rate-limit headers
+    report an exhausted budget, and each 429, 5xx or timeout halves its
+    concurrency limit. At most BULKHEAD_SIZE requests per host are in flight,
+    and while the host's circuit breaker is open requests wait for its
+    recovery probe, or fail at once if that would not fit the deadline. Only
+    failures that are not going to be retried count towards opening it.
+    Each attempt is bounded by TIMEOUT, and no attempt is started that could
+    not finish within deadline seconds of the first one. With compress set,
+    bodies over GZIP_MIN_BYTES are sent gzip-encoded unless the host has
+    refused that before.
+
+    Args:
+        session (HTTPSession): Session to send the request on
+        url (str): Endpoint to POST to
+        headers (Mapping[str, str]): Request headers
+        json (Any): JSON-serializable request body
+        max_retries (int): Retries allowed after the first attempt
+        deadline (float): Seconds allowed for all attempts and waits together
+        compress (bool): Gzip large request bodies
+
+    Returns:
+        bytes: Raw response body, exactly as received
+
+    Raises:
+        CircuitOpenError: If the host's circuit stays open past the deadline
+        RetryDeadlineError: If the deadline leaves no time for a retry
+        aiohttp.ClientResponseError: On a non-retryable or final bad status
+        aiohttp.ClientError: On a non-retryable or final request failure
+        asyncio.TimeoutError: If the final attempt timed out
+    """
+    state: RateLimitState = rate_limit_state(url)
+    breaker: CircuitBreaker = circuit_breaker(url)
+    started_at: float = time.monotonic()
+    attempt: int = 0
+    backoff: float = 0.0
+    last_error: str = ''
+
+    def time_left(upcoming_wait: float = 0.0) -> float:
+        left: float = deadline - (time.monotonic() - started_at) - upcoming_wait
+        if left < MIN_ATTEMPT_SECONDS:
+            raise RetryDeadlineError(
+                f"{url}: gave up after {attempt} attempt(s), {deadline:g}s deadline reached"
+                + (f"; last error: {last_error}" if last_error else "")
+            )
+        return left
+
+    # Serialize once up front; every attempt resends the same bytes
+    host: str = _host(url)
+    request_body: bytes = json_dumps(json)
+    plain_headers: Mapping[str, str] = headers
+    if not any(name.lower() == 'content-type' for name in headers):
+        plain_headers = {**headers, 'Content-Type': 'application/json'}
+    # Bind everything but the per-attempt timeout once, for each encoding
+    post_plain: Callable[..., Any] = partial(session.post, url, headers=plain_headers, data=request_body)
+    post_gzip: Union[Callable[..., Any], None] = None
+    if compress and len(request_body) > GZIP_MIN_BYTES and host not in _gzip_rejected:
+        # Level 1 keeps CPU cost negligible; nearly all the size win remains
+        post_gzip = partial(
+            session.post,
+            url,
+            headers={**plain_headers, 'Content-Encoding': 'gzip'},
+            data=gzip.compress(request_body, compresslevel=1)
+        )
+
+    while True:
+        time_left(backoff + state.pause())
+        if backoff > 0:
+            await asyncio.sleep(backoff)
+        await state.wait()
+        retry_after: Union[float, None] = None
+        send_gzip: bool = post_gzip is not None and host not in _gzip_rejected
+        resend_plain: bool = False
+        # Wait out an open circuit when its recovery fits the deadline, and
+        # fail fast otherwise, before queueing for a slot behind requests to
+        # a dead host
+        await breaker.wait(time_left() - MIN_ATTEMPT_SECONDS)
+        async with state.limiter, _bulkhead(url):
+            if breaker.is_open():
+                # Another request took the half-open probe while this one
+                # queued; wait for its outcome again
+                backoff = 0.0
+                continue
+            # Never let one attempt run past the overall deadline. This can
+            # raise after waiting for a slot, so it runs before a half-open
+            # circuit hands this request the probe.
+            timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(
+                total=min(TIMEOUT.total or deadline, time_left()),
+                connect=TIMEOUT.connect,
+                sock_connect=TIMEOUT.sock_connect,
+                sock_read=TIMEOUT.sock_read
+            )
+            breaker.before_request()
+            started: float = time.monotonic()
+            try:
+                async with (post_gzip if send_gzip and post_gzip is not None else post_plain)(
+                    timeout=timeout
+                ) as response:
+                    state.update(response.headers)
+                    # A status that is about to be retried is not yet a
+                    # failure, so one short burst of 503s does not open the
+                    # circuit on requests that still have retries left
+                    retrying: bool = response.status in RETRY_STATUSES and attempt < max_retries
+                    if response.status < 500:
+                        breaker.record_success()
+                    elif not retrying:
+                        breaker.record_failure(f"HTTP {response.status}")
+                    if response.status == 429 or response.status >= 500:
+                        state.limiter.decrease()
+                    if send_gzip and response.status in GZIP_REJECT_STATUSES:
+                        logger.info("%s refused a gzip request body (HTTP %d); sending uncompressed", host, response.status)
+                        _gzip_rejected.add(host)
+                        resend_plain = True
+                    elif not retrying:
+                        response.raise_for_status()
+                        response_body: bytes = await response.read()
+                        state.limiter.record_latency(time.monotonic() - started)
+                        return response_body
+                    else:
+                        retry_after = _retry_after(response.headers)
+                        last_error = f"HTTP {response.status}"
+                        logger.warning("%s returned HTTP %d (attempt %d)", url, response.status, attempt + 1)
+            except (aiohttp.ServerDisconnectedError, asyncio.TimeoutError) as e:
+                state.limiter.decrease()
+                if attempt >= max_retries:
+                    breaker.record_failure(repr(e))
+                    raise
+                last_error = repr(e)
+                logger.warning("%s request failed: %r (attempt %d)", url, e, attempt + 1)
+            except aiohttp.ClientConnectionError as e:
+                breaker.record_failure(repr(e))
+                raise
+            finally:
+                breaker.release_probe()
+
+        # Resending without gzip is not a retry: no backoff, no attempt used
+        if resend_plain:
+            backoff = 0.0
+            continue
+
+        # A Retry-After was recorded on the host state, so state.wait() at
+        # the top of the loop sleeps for it; otherwise back off first
+        backoff = _backoff(attempt) if retry_after is None else 0.0
+        attempt += 1
+
+async def send_many(
+    send: Callable[[str, Union[HTTPSession, None]], Awaitable[str]],
+    texts: Sequence[str],
+    session: Union[HTTPSession, None] = None
+) -> list[str]:
+    """
+    Run send over many texts concurrently on one session
+
+    All requests are started at once; how many are actually in flight per
+    host is governed by that host's adaptive ConcurrencyLimiter.
+
+    Args:
+        send (Callable): A send_to_* function taking (text, session)
+        texts (Sequence[str]): Documents to send
+        session (HTTPSession, optional): Session to send the
+            requests on; defaults to the shared session
+
+    Returns:
+        list[str]: One API response or error message per text, in order
+    """
+    if session is None:
+        session = get_session()
+    return list(await asyncio.gather(*(send(text, session) for text in texts)))
+
+def _provider_error(message: str) -> ProviderError:
+    logger.error(message)
+    return ProviderError(message)
+
+async def run_provider(
+    spec: ProviderSpec,
+    text: str,
+    session: Union[HTTPSession, None] = None,
+    cache: Union[ResponseCache, None] = None
+) -> str:
+    """
+    Send text to a provider's AI detection API
+
+    Args:
+        spec (ProviderSpec): Provider to send to
+        text (str): Input text to send
+        session (HTTPSession, optional): Session to send the request
+            on; defaults to the shared session
+        cache (ResponseCache, optional): Cache to serve repeated texts from
+            and store successful responses in
+
+    Returns:
+        str: API response body, as received
+
+    Raises:
+        ProviderError: If the API key is missing or the request failed
+    """
+    # The API key was read from the environment when spec was created
+    if not spec.api_key:
+        raise _provider_error(f"{spec.api_key_env} environment variable not set")
+
+    # Serve repeated documents without calling the API
+    if cache is not None:
+        cached: Union[bytes, None] = cache.get(text)
+        if cached is not None:
+            try:
+                cached_result: str = cached.decode()
+            except UnicodeDecodeError:
+                logger.warning("%s ignoring undecodable cache entry", spec.display_name)
+            else:
+                logger.info("%s API response served from cache: %d bytes", spec.display_name, len(cached))
+                return cached_result
+
+    # Make async API call over the shared keep-alive session; retries
+    # transient failures, anything else raises
+    if session is None:
+        session = get_session()
+    try:
+        body: bytes = await post_with_retry(
+            session,
+            spec.url,
+            headers=spec.headers,
+            json=spec.payload_fn(text),
+            compress=spec.compress_requests
+        )
+        # Pass the body through as received rather than re-serializing it
+        result: str = body.decode()
+    except aiohttp.ClientResponseError as e:
+        raise _provider_error(f"API response error: {e}") from e
+    except aiohttp.ClientError as e:
+        raise _provider_error(f"API request failed: {e}") from e
+    except Exception as e:
+        raise _provider_error(f"Unexpected error: {e}") from e
+
+    logger.info("%s API response received: %d bytes", spec.display_name, len(body))
+    logger.debug("%s API response: %s", spec.display_name, result)
+    if cache is not None:
+        cache.put(text, body)
+    return result
+
+async def send_to_provider(
+    spec: ProviderSpec,
+    text: str,
+    session: Union[HTTPSession, None] = None,
+    cache: Union[ResponseCache, None] = None
+) -> str:
+    """
+    Like run_provider, but return the error message instead of raising
+
+    Returns:
+        str: API response or error message
+    """
+    try:
+        return await run_provider(spec, text, session, cache)
+    except ProviderError as e:
+        return str(e)
+
+async def detect_all(
+    text: str,
+    providers: Sequence[ProviderSpec],
+    session: Union[HTTPSession, None] = None,
+    cache_mode: str = 'off'
+) -> Dict[str, Union[str, BaseException]]:
+    """
+    Send text to several providers concurrently on one session
+
+    Args:
+        text (str): Input text to send
+        providers (Sequence[ProviderSpec]): Providers to send to
+        session (HTTPSession, optional): Session to send the
+            requests on; defaults to the shared session
+        cache_mode (str): ResponseCache mode to use for every provider
+
+    Returns:
+        Dict[str, Union[str, BaseException]]: Provider name to its API
+            response, or to the exception (usually ProviderError) it raised
+    """
+    if session is None:
+        session = get_session()
+    results: list[Union[str, BaseException]] = await asyncio.gather(
+        *(run_provider(p, text, session, ResponseCache(p.name, cache_mode)) for p in providers),
+        return_exceptions=True
+    )
+    return dict(zip((p.name for p in providers), results))
+
+def _parse_jsonl_document(line: str) -> str:
+    # A line is a JSON string, or an object with a "text" member
+    value: Any = json_loads(line)
+    if isinstance(value, dict):
+        value = value.get('text')
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError('expected a non-empty JSON string or an object with a "text" string')
+    return value
+
+def _jsonl_line(result: str) -> str:
+    # Compact JSON responses onto one line; wrap plain-text error messages
+    try:
+        return json_dumps(json_loads(result)).decode()
+    except ValueError:
+        return json_dumps({"error": result}).decode()
+
+async def _handle_jsonl(
+    input_text: str,
+    session: HTTPSession,
+    args: argparse.Namespace,
+    handle: Callable[[str, HTTPSession, argparse.Namespace], Awaitable[str]]
+) -> str:
+    # Every line shares the session's connection pool; at most BULKHEAD_SIZE
+    # documents are in progress at once, so huge inputs don't flood the loop
+    limit: asyncio.Semaphore = asyncio.Semaphore(BULKHEAD_SIZE)
+
+    async def handle_line(line: str) -> str:
+        if not line.strip():
+            return json_dumps({"error": "Invalid JSON Lines document: blank line"}).decode()
+        try:
+            text: str = _parse_jsonl_document(line)
+        except ValueError as e:
+            return json_dumps({"error": f"Invalid JSON Lines document: {e}"}).decode()
+        async with limit:
+            return _jsonl_line(await handle(text, session, args))
+
+    # One result per input line, blank ones included, so output line N always
+    # answers input line N
+    lines: list[str] = input_text.splitlines()
+    return '\n'.join(await asyncio.gather(*(handle_line(line) for line in lines)))
+
+async def _run_cli(
+    name: str,
+    description: str,
+    providers: Sequence[ProviderSpec],
+    handle: Callable[[str, HTTPSession, argparse.Namespace], Awaitable[str]],
+    argv: Union[list[str], None]
+) -> None:
+    # Shared body of the pipe entrypoints: parse args, check API keys, set up
+    # logging, read stdin while warming up connections to the providers, then
+    # print handle()'s result
+    parser: argparse.ArgumentParser = build_arg_parser(description)
+    args: argparse.Namespace = parser.parse_args(argv)
+    if args.jsonl and args.pretty:
+        # Re-indented results would no longer be one JSON document per line
+        parser.error("--pretty cannot be combined with --jsonl")
+    if args.http2 and not HAS_HTTPX:
+        parser.error("--http2 needs httpx[http2]; install the http2 extra")
+
+    # Fail before touching the network or stdin if any API key is missing
+    missing: list[str] = [spec.api_key_env for spec in providers if not spec.api_key]
+    if missing:
+        for api_key_env in missing:
+            print(f"{api_key_env} environment variable not set", file=sys.stderr)
+        sys.exit(1)
+
+    # Configure logging; the file is opened on first use and written to from
+    # a background thread
+    configure_logging(os.path.join(LOGS_DIR, f'{name}_pipe.log'))
+
+    # Start DNS + TLS warmup to the APIs while stdin is still being read
+    session: HTTPSession = get_session(http2=args.http2)
+    warmup_task: asyncio.Future[list[None]] = asyncio.gather(*(warmup(session, spec.url) for spec in providers))
+    try:
+        # Read from stdin
+        raw_input: str = await read_stdin()
+        input_text: str = raw_input.strip()
+
+        if not input_text:
+            # Not logged, so a health-check run with empty stdin creates no file
+            print("No input received", file=sys.stderr)
+            sys.exit(1)
+
+        # Log input
+        logger.info("Received input: %d characters", len(input_text))
+        logger.debug("Input text: %s", input_text)
+
+        # Send to the APIs, reusing the warmed-up session
+        await warmup_task
+        if args.jsonl:
+            # Unstripped, so leading blank lines keep their place
+            result: str = await _handle_jsonl(raw_input, session, args, handle)
+        else:
+            result = await handle(input_text, session, args)
+    finally:
+        warmup_task.cancel()
+        # Let cancelled warmups unwind before the session and resolver close
+        await asyncio.gather(warmup_task, return_exceptions=True)
+        await close_session()
+
+    # Print result
+    write_output(result, pretty=args.pretty)
+
+async def run_pipe(spec: ProviderSpec, argv: Union[list[str], None] = None) -> None:
+    """
+    Command-line entrypoint: send stdin to spec's API and print the result
+
+    Args:
+        spec (ProviderSpec): Provider to send to
+        argv (list[str], optional): Arguments to parse instead of sys.argv
+    """
+    async def handle(text: str, session: HTTPSession, args: argparse.Namespace) -> str:
+        return await send_to_provider(spec, text, session, ResponseCache(spec.name, args.cache))
+
+    await _run_cli(spec.name, f'Send stdin to the {spec.display_name} AI Detection API', [spec], handle, argv)
+
+async def run_detect_all_pipe(providers: Sequence[ProviderSpec], argv: Union[list[str], None] = None) -> None:
+    """
+    Command-line entrypoint: send stdin to every provider concurrently
+
+    Prints one JSON object keyed by provider name. Each value is that
+    provider's response, or {"error": message} if it failed.
+
+    Args:
+        providers (Sequence[ProviderSpec]): Providers to send to
+        argv (list[str], optional): Arguments to parse instead of sys.argv
+    """
+    async def handle(text: str, session: HTTPSession, args: argparse.Namespace) -> str:
+        merged: Dict[str, Any] = {}
+        for name, result in (await detect_all(text, providers, session, args.cache)).items():
+            if isinstance(result, BaseException):
+                merged[name] = {"error": str(result)}
+                continue
+            try:
+                merged[name] = json_loads(result)
+            except ValueError:
+                merged[name] = result
+        return json_dumps(merged).decode()
+
+    names: str = ', '.join(p.display_name for p in providers)
+    await _run_cli('detect_all', f'Send stdin to {names} concurrently', providers, handle, argv)
+
+def run(main: Coroutine[Any, Any, T]) -> T:
+    """asyncio.run(main), on a uvloop event loop when uvloop is installed"""
+    if HAS_UVLOOP and uvloop is not None:
+        return asyncio.run(main, loop_factory=uvloop.new_event_loop)
+    return asyncio.run(main)
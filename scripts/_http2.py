@@ -0,0 +1,128 @@
+import asyncio
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from typing import AsyncIterator, Mapping, Union
+
+import aiohttp
+import h2  # noqa: F401 - only needed by httpx for http2=True
+import httpx
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+from _base import TIMEOUT
+
+# HTTP/2 backend for the pipes, selected with --http2; needs the http2 extra.
+# _base imports this module only when an HTTP/2 session is requested.
+
+def _aiohttp_error(e: Exception) -> Exception:
+    # Map httpx failures onto the aiohttp exceptions post_with_retry handles
+    if isinstance(e, httpx.TimeoutException):
+        return asyncio.TimeoutError(str(e))
+    if isinstance(e, httpx.RemoteProtocolError):
+        return aiohttp.ServerDisconnectedError(str(e))
+    if isinstance(e, httpx.NetworkError):
+        return aiohttp.ClientConnectionError(str(e))
+    return aiohttp.ClientError(str(e))
+
+class Http2Response:
+    """The part of aiohttp.ClientResponse that post_with_retry uses, over httpx"""
+
+    def __init__(self, response: httpx.Response) -> None:
+        self._response: httpx.Response = response
+        self.status: int = response.status_code
+        self.headers: Mapping[str, str] = response.headers
+
+    async def read(self) -> bytes:
+        try:
+            return await self._response.aread()
+        except httpx.HTTPError as e:
+            raise _aiohttp_error(e) from e
+
+    def raise_for_status(self) -> None:
+        if self.status < 400:
+            return
+        request: httpx.Request = self._response.request
+        raise aiohttp.ClientResponseError(
+            aiohttp.RequestInfo(
+                URL(str(request.url)),
+                request.method,
+                CIMultiDictProxy(CIMultiDict(request.headers.items()))
+            ),
+            (),
+            status=self.status,
+            message=self._response.reason_phrase,
+            headers=CIMultiDictProxy(CIMultiDict(self._response.headers.items()))
+        )
+
+class Http2Session:
+    """
+    HTTP/2 stand-in for aiohttp.ClientSession, backed by httpx.AsyncClient
+
+    Implements only what the pipes call (post, head, closed and close), and
+    raises aiohttp exceptions, so post_with_retry works unchanged while
+    concurrent requests to a host share one multiplexed connection.
+    """
+
+    def __init__(self, transport: Union[httpx.AsyncBaseTransport, None] = None) -> None:
+        self._client: httpx.AsyncClient = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=75),
+            transport=transport
+        )
+
+    @property
+    def closed(self) -> bool:
+        return self._client.is_closed
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    @asynccontextmanager
+    async def _request(
+        self,
+        method: str,
+        url: Union[str, URL],
+        headers: Union[Mapping[str, str], None],
+        data: Union[bytes, None],
+        timeout: aiohttp.ClientTimeout,
+        allow_redirects: bool
+    ) -> AsyncIterator[Http2Response]:
+        # httpx has no overall timeout, so the total is enforced around the
+        # whole exchange, body read included, as aiohttp does
+        read_timeout: Union[float, None] = timeout.sock_read or timeout.total
+        request: httpx.Request = self._client.build_request(
+            method,
+            str(url),
+            headers=headers,
+            content=data,
+            timeout=httpx.Timeout(read_timeout, connect=timeout.connect or timeout.sock_connect)
+        )
+        async with asyncio.timeout(timeout.total):
+            try:
+                response: httpx.Response = await self._client.send(
+                    request,
+                    stream=True,
+                    follow_redirects=allow_redirects
+                )
+            except httpx.HTTPError as e:
+                raise _aiohttp_error(e) from e
+            try:
+                yield Http2Response(response)
+            finally:
+                await response.aclose()
+
+    def post(
+        self,
+        url: Union[str, URL],
+        headers: Union[Mapping[str, str], None] = None,
+        data: Union[bytes, None] = None,
+        timeout: aiohttp.ClientTimeout = TIMEOUT
+    ) -> AbstractAsyncContextManager[Http2Response]:
+        return self._request('POST', url, headers, data, timeout, allow_redirects=True)
+
+    def head(
+        self,
+        url: Union[str, URL],
+        allow_redirects: bool = False,
+        timeout: aiohttp.ClientTimeout = TIMEOUT
+    ) -> AbstractAsyncContextManager[Http2Response]:
+        return self._request('HEAD', url, None, None, timeout, allow_redirects)
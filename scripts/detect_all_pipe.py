@@ -0,0 +1,5 @@
+from _base import run, run_detect_all_pipe
+from providers import GPTZERO, ZEROGPT
+
+if __name__ == "__main__":
+    run(run_detect_all_pipe([GPTZERO, ZEROGPT]))
@@ -0,0 +1,47 @@
+from typing import Any, Dict
+
+from _base import ProviderSpec
+
+def _gptzero_headers(api_key: str) -> Dict[str, str]:
+    return {
+        'Accept': 'application/json',
+        'Content-Type': 'application/json',
+        'x-api-key': api_key
+    }
+
+def _gptzero_payload(text: str) -> Dict[str, Any]:
+    return {
+        "document": text,
+        "multilingual": False
+    }
+
+def _zerogpt_headers(api_key: str) -> Dict[str, str]:
+    return {
+        'Content-Type': 'application/json',
+        'ApiKey': api_key
+    }
+
+def _zerogpt_payload(text: str) -> Dict[str, Any]:
+    return {
+        "input_text": text
+    }
+
+# Neither API is known to accept gzip request bodies, so compress_requests
+# stays off until a provider is confirmed to decode them
+GPTZERO: ProviderSpec = ProviderSpec(
+    name='gptzero',
+    display_name='GPTZero',
+    url='https://api.gptzero.me/v2/predict/text',
+    api_key_env='GPTZERO_API_KEY',
+    headers_fn=_gptzero_headers,
+    payload_fn=_gptzero_payload
+)
+
+ZEROGPT: ProviderSpec = ProviderSpec(
+    name='zerogpt',
+    display_name='ZeroGPT',
+    url='https://api.zerogpt.com/api/detect/detectText',
+    api_key_env='ZEROGPT_API_KEY',
+    headers_fn=_zerogpt_headers,
+    payload_fn=_zerogpt_payload
+)
@@ -0,0 +1,504 @@
+import pytest
+import sys
+import os
+from unittest.mock import patch, AsyncMock, MagicMock
+import aiohttp
+import asyncio
+import gzip
+import io
+import json
+import logging
+from typing import Any, Dict, Iterator, Union
+
+# Add scripts directory to path for imports
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, SCRIPT_DIR)
+
+# Import the functions to test
+from _base import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ConcurrencyLimiter,
+    LazyRotatingFileHandler,
+    ProviderError,
+    ProviderSpec,
+    RateLimitState,
+    ResponseCache,
+    RetryDeadlineError,
+    RingBufferHandler,
+    detect_all,
+    post_with_retry,
+    rate_limit_state,
+    read_stdin,
+    send_many,
+    write_output
+)
+import _base
+
+@pytest.fixture(autouse=True)
+def reset_host_state() -> Iterator[None]:
+    """Keep per-host state from leaking between tests"""
+    _base._reset_host_state()
+    yield
+    _base._reset_host_state()
+
+def make_response(status: int, body: Any = None, headers: Union[Dict[str, str], None] = None) -> MagicMock:
+    """Build a mock response with the given status, JSON body and headers"""
+    response: MagicMock = MagicMock()
+    response.status = status
+    response.headers = headers or {}
+    response.read = AsyncMock(return_value=json.dumps(body).encode())
+
+    def raise_for_status() -> None:
+        if status >= 400:
+            raise aiohttp.ClientResponseError(MagicMock(), (), status=status)
+
+    response.raise_for_status = raise_for_status
+    return response
+
+def make_session(*outcomes: Any) -> MagicMock:
+    """Build a mock session whose successive post() calls yield outcomes"""
+    contexts: list[MagicMock] = []
+    for outcome in outcomes:
+        context: MagicMock = MagicMock()
+        if isinstance(outcome, BaseException):
+            context.__aenter__ = AsyncMock(side_effect=outcome)
+        else:
+            context.__aenter__ = AsyncMock(return_value=outcome)
+        context.__aexit__ = AsyncMock(return_value=False)
+        contexts.append(context)
+    session: MagicMock = MagicMock()
+    session.post.side_effect = contexts
+    return session
+
+@pytest.mark.asyncio
+async def test_post_with_retry_retries_transient_status() -> None:
+    """Test that 503 and a dropped connection are retried until success"""
+    session: MagicMock = make_session(
+        make_response(503),
+        aiohttp.ServerDisconnectedError(),
+        make_response(200, {"ok": True})
+    )
+    with patch('asyncio.sleep', new=AsyncMock()) as mock_sleep:
+        result: Any = await post_with_retry(session, 'https://example.test', {}, {})
+
+    assert json.loads(result) == {"ok": True}
+    assert session.post.call_count == 3
+    assert mock_sleep.await_count == 2
+
+@pytest.mark.asyncio
+async def test_post_with_retry_does_not_retry_client_errors() -> None:
+    """Test that a 401 is raised without retrying"""
+    session: MagicMock = make_session(make_response(401))
+    with patch('asyncio.sleep', new=AsyncMock()) as mock_sleep, \
+         pytest.raises(aiohttp.ClientResponseError) as excinfo:
+        await post_with_retry(session, 'https://example.test', {}, {})
+
+    assert excinfo.value.status == 401
+    assert session.post.call_count == 1
+    mock_sleep.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_post_with_retry_honors_retry_after() -> None:
+    """Test that Retry-After is used instead of the computed backoff"""
+    session: MagicMock = make_session(
+        make_response(429, headers={'Retry-After': '7'}),
+        make_response(200, {"ok": True})
+    )
+    with patch('asyncio.sleep', new=AsyncMock()) as mock_sleep:
+        await post_with_retry(session, 'https://example.test', {}, {})
+
+    mock_sleep.assert_awaited_once()
+    assert mock_sleep.await_args is not None
+    assert mock_sleep.await_args.args[0] == pytest.approx(7.0, abs=0.5)
+
+@pytest.mark.asyncio
+async def test_post_with_retry_gives_up_after_max_retries() -> None:
+    """Test that the final transient status is raised once retries run out"""
+    session: MagicMock = make_session(make_response(502), make_response(502))
+    with patch('asyncio.sleep', new=AsyncMock()), \
+         pytest.raises(aiohttp.ClientResponseError) as excinfo:
+        await post_with_retry(session, 'https://example.test', {}, {}, max_retries=1)
+
+    assert excinfo.value.status == 502
+    assert session.post.call_count == 2
+
+@pytest.mark.asyncio
+async def test_post_with_retry_pauses_on_low_rate_limit_budget() -> None:
+    """Test that a nearly exhausted budget delays the next request"""
+    session: MagicMock = make_session(
+        make_response(200, {}, {'x-ratelimit-remaining-requests': '1', 'x-ratelimit-reset-requests': '2s'}),
+        make_response(200, {})
+    )
+    with patch('asyncio.sleep', new=AsyncMock()) as mock_sleep:
+        await post_with_retry(session, 'https://ratelimit.test', {}, {})
+        mock_sleep.assert_not_awaited()
+        await post_with_retry(session, 'https://ratelimit.test', {}, {})
+
+    mock_sleep.assert_awaited_once()
+    assert mock_sleep.await_args is not None
+    assert mock_sleep.await_args.args[0] == pytest.approx(2.0, abs=0.5)
+
+@pytest.mark.asyncio
+async def test_post_with_retry_halves_concurrency_on_429() -> None:
+    """Test that a 429 multiplicatively decreases the host's concurrency"""
+    session: MagicMock = make_session(make_response(429), make_response(200, {}))
+    state: RateLimitState = rate_limit_state('https://concurrency.test')
+    before: float = state.limiter.limit
+    with patch('asyncio.sleep', new=AsyncMock()):
+        await post_with_retry(session, 'https://concurrency.test', {}, {})
+
+    assert state.limiter.limit == before * 0.5
+
+def test_concurrency_limiter_aimd() -> None:
+    """Test additive increase on a fast window and halving on a slow one"""
+    limiter: ConcurrencyLimiter = ConcurrencyLimiter(limit=4)
+    for _ in range(_base.LATENCY_WINDOW):
+        limiter.record_latency(0.1)
+    assert limiter.limit == 4 + _base.CONCURRENCY_STEP
+
+    for _ in range(_base.LATENCY_WINDOW):
+        limiter.record_latency(_base.TARGET_LATENCY * 2)
+    assert limiter.limit == (4 + _base.CONCURRENCY_STEP) / 2
+
+    limiter.decrease()
+    limiter.decrease()
+    limiter.decrease()
+    assert limiter.limit == _base.MIN_CONCURRENCY
+
+@pytest.mark.asyncio
+async def test_send_many_preserves_order() -> None:
+    """Test that send_many returns one result per text, in input order"""
+    async def send(text: str, session: Any) -> str:
+        await asyncio.sleep(0.01 if text == "slow" else 0)
+        return text.upper()
+
+    results: list[str] = await send_many(send, ["slow", "fast"], MagicMock())
+    assert results == ["SLOW", "FAST"]
+
+@pytest.mark.asyncio
+async def test_circuit_opens_and_fails_fast() -> None:
+    """Test that repeated connection failures open the circuit"""
+    threshold: int = _base.CIRCUIT_ERROR_THRESHOLD
+    session: MagicMock = make_session(*[aiohttp.ClientConnectionError("refused")] * threshold)
+    for _ in range(threshold):
+        with pytest.raises(aiohttp.ClientConnectionError):
+            await post_with_retry(session, 'https://down.test', {}, {})
+
+    # The recovery period does not fit in this deadline, so there is no wait
+    with pytest.raises(CircuitOpenError) as excinfo:
+        await post_with_retry(session, 'https://down.test', {}, {}, deadline=10)
+    assert "refused" in str(excinfo.value)
+    assert session.post.call_count == threshold
+
+@pytest.mark.asyncio
+async def test_open_circuit_fails_before_waiting_for_a_slot() -> None:
+    """Test that an open circuit is reported without queueing behind busy slots"""
+    breaker: CircuitBreaker = _base.circuit_breaker('https://busy.test')
+    breaker.error_threshold = 1
+    breaker.record_failure("HTTP 503")
+    session: MagicMock = make_session()
+    state: RateLimitState = rate_limit_state('https://busy.test')
+    await state.limiter.acquire()
+    state.limiter.limit = 1
+
+    with pytest.raises(CircuitOpenError):
+        await asyncio.wait_for(post_with_retry(session, 'https://busy.test', {}, {}, deadline=10), timeout=1)
+    session.post.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_deadline_while_queued_keeps_probe_available() -> None:
+    """Test that a deadline hit while waiting for a slot does not hold the half-open probe"""
+    breaker: CircuitBreaker = _base.circuit_breaker('https://probe.test')
+    breaker.error_threshold = 1
+    breaker.recovery_seconds = 0
+    breaker.record_failure("HTTP 503")
+    state: RateLimitState = rate_limit_state('https://probe.test')
+    state.limiter.limit = 1
+    await state.limiter.acquire()
+    asyncio.get_running_loop().call_later(0.1, state.limiter.release)
+
+    with pytest.raises(RetryDeadlineError):
+        await post_with_retry(make_session(), 'https://probe.test', {}, {}, deadline=1.05)
+
+    session: MagicMock = make_session(make_response(200, {"ok": True}))
+    assert await post_with_retry(session, 'https://probe.test', {}, {}) == b'{"ok": true}'
+    assert breaker.state == CircuitBreaker.CLOSED
+
+@pytest.mark.asyncio
+async def test_concurrent_503_burst_is_retried_through_the_circuit() -> None:
+    """Test that one wave of 503s to concurrent requests does not fail them fast"""
+    breaker: CircuitBreaker = _base.circuit_breaker('https://burst.test')
+    wave: int = _base.INITIAL_CONCURRENCY
+    seen: set[bytes] = set()
+    burst: asyncio.Event = asyncio.Event()
+
+    async def answer(data: bytes) -> MagicMock:
+        # Every document's first attempt is held until the whole wave is in
+        # flight and then gets a 503; its retry succeeds
+        if data in seen:
+            return make_response(200, {})
+        seen.add(data)
+        if len(seen) == wave:
+            burst.set()
+        await burst.wait()
+        return make_response(503)
+
+    def post(url: str, headers: Any, data: bytes, timeout: Any) -> MagicMock:
+        async def enter(*args: Any) -> MagicMock:
+            return await answer(data)
+
+        context: MagicMock = MagicMock()
+        context.__aenter__ = AsyncMock(side_effect=enter)
+        context.__aexit__ = AsyncMock(return_value=False)
+        return context
+
+    session: MagicMock = MagicMock()
+    session.post.side_effect = post
+    with patch('_base._backoff', return_value=0.0):
+        results: list[Any] = await asyncio.gather(
+            *(post_with_retry(session, 'https://burst.test', {}, {"i": i}) for i in range(wave)),
+            return_exceptions=True
+        )
+
+    assert results == [b'{}'] * wave
+    assert breaker.state == CircuitBreaker.CLOSED
+
+@pytest.mark.asyncio
+async def test_open_circuit_waits_for_the_probe() -> None:
+    """Test that requests wait for recovery and the probe instead of failing fast"""
+    breaker: CircuitBreaker = _base.circuit_breaker('https://recovering.test')
+    breaker.error_threshold = 1
+    breaker.recovery_seconds = 0.05
+    breaker.record_failure("HTTP 503")
+    session: MagicMock = make_session(make_response(200, {}), make_response(200, {}))
+
+    results: list[bytes] = list(await asyncio.gather(
+        post_with_retry(session, 'https://recovering.test', {}, {}),
+        post_with_retry(session, 'https://recovering.test', {}, {})
+    ))
+
+    assert results == [b'{}', b'{}']
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_circuit_half_open_allows_one_probe() -> None:
+    """Test that after recovery a single probe is let through"""
+    breaker: CircuitBreaker = CircuitBreaker('probe.test', error_threshold=1, recovery_seconds=0)
+    breaker.record_failure("HTTP 503")
+    assert breaker.state == CircuitBreaker.OPEN
+
+    breaker.before_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_write_output_pretty(capsys: Any) -> None:
+    """Test that --pretty re-indents JSON and leaves error text alone"""
+    write_output('{"a":1}', pretty=True)
+    write_output('API request failed: boom', pretty=True)
+
+    captured: Any = capsys.readouterr()
+    assert captured.out == '{\n  "a": 1\n}\nAPI request failed: boom\n'
+
+def test_response_cache_round_trip(tmp_path: Any) -> None:
+    """Test that a stored response is served until its TTL runs out"""
+    cache: ResponseCache = ResponseCache('provider', directory=str(tmp_path), ttl=60)
+    assert cache.get("Test input") is None
+
+    cache.put("Test input", b'{"ok": true}')
+    assert cache.get("Test input") == b'{"ok": true}'
+    assert cache.get("Other input") is None
+
+    # Age the entry past its TTL
+    entry: str = os.path.join(str(tmp_path), 'provider', os.listdir(os.path.join(str(tmp_path), 'provider'))[0])
+    os.utime(entry, (0, 0))
+    assert cache.get("Test input") is None
+
+def test_response_cache_modes(tmp_path: Any) -> None:
+    """Test that readOnly never writes and writeOnly never reads"""
+    ResponseCache('provider', 'readOnly', directory=str(tmp_path)).put("Test input", b'{}')
+    assert not os.path.exists(os.path.join(str(tmp_path), 'provider'))
+
+    write_only: ResponseCache = ResponseCache('provider', 'writeOnly', directory=str(tmp_path))
+    write_only.put("Test input", b'{}')
+    assert write_only.get("Test input") is None
+    assert ResponseCache('provider', directory=str(tmp_path)).get("Test input") == b'{}'
+    assert ResponseCache('provider', 'off', directory=str(tmp_path)).get("Test input") is None
+
+@pytest.mark.asyncio
+async def test_post_with_retry_stops_at_deadline() -> None:
+    """Test that a Retry-After beyond the deadline aborts instead of waiting"""
+    session: MagicMock = make_session(make_response(503, headers={'Retry-After': '120'}))
+    with patch('asyncio.sleep', new=AsyncMock()) as mock_sleep, \
+         pytest.raises(RetryDeadlineError) as excinfo:
+        await post_with_retry(session, 'https://slow.test', {}, {}, deadline=30)
+
+    assert "HTTP 503" in str(excinfo.value)
+    assert session.post.call_count == 1
+    mock_sleep.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_read_stdin_from_pipe(monkeypatch: Any) -> None:
+    """Test that piped stdin is read through the event loop and left open"""
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, "piped input\n".encode())
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'r') as stdin:
+        monkeypatch.setattr('sys.stdin', stdin)
+        assert await read_stdin() == "piped input\n"
+        assert not stdin.closed
+
+@pytest.mark.asyncio
+async def test_detect_all_collects_every_provider() -> None:
+    """Test that detect_all returns each provider's response or exception"""
+    def make_spec(name: str) -> ProviderSpec:
+        return ProviderSpec(
+            name=name,
+            display_name=name,
+            url=f'https://{name}.test/detect',
+            api_key_env=f'{name.upper()}_API_KEY',
+            headers_fn=lambda api_key: {'key': api_key},
+            payload_fn=lambda text: {'text': text}
+        )
+
+    with patch.dict(os.environ, {'OK_API_KEY': 'test_key'}, clear=True):
+        ok: ProviderSpec = make_spec('ok')
+        missing_key: ProviderSpec = make_spec('missing')
+    session: MagicMock = make_session(make_response(200, {"score": 1}))
+
+    results: Dict[str, Any] = await detect_all("Test input", [ok, missing_key], session)
+
+    assert json.loads(results['ok']) == {"score": 1}
+    assert isinstance(results['missing'], ProviderError)
+    assert "MISSING_API_KEY environment variable not set" in str(results['missing'])
+
+@pytest.mark.asyncio
+async def test_post_with_retry_gzips_large_bodies() -> None:
+    """Test that large bodies are gzipped and small ones are not"""
+    session: MagicMock = make_session(make_response(200, {}), make_response(200, {}))
+    large: Dict[str, str] = {"text": "x" * (_base.GZIP_MIN_BYTES * 2)}
+    await post_with_retry(session, 'https://gzip.test', {}, large, compress=True)
+    await post_with_retry(session, 'https://gzip.test', {}, {"text": "short"}, compress=True)
+
+    first: Any = session.post.call_args_list[0].kwargs
+    assert first['headers']['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(first['data'])) == large
+    second: Any = session.post.call_args_list[1].kwargs
+    assert 'Content-Encoding' not in second['headers']
+    assert json.loads(second['data']) == {"text": "short"}
+
+@pytest.mark.asyncio
+async def test_post_with_retry_falls_back_when_gzip_refused() -> None:
+    """Test that a 415 on a gzipped body resends it uncompressed"""
+    session: MagicMock = make_session(make_response(415), make_response(200, {"ok": True}))
+    large: Dict[str, str] = {"text": "x" * (_base.GZIP_MIN_BYTES * 2)}
+    with patch('asyncio.sleep', new=AsyncMock()) as mock_sleep:
+        result: bytes = await post_with_retry(session, 'https://nogzip.test', {}, large, compress=True, max_retries=0)
+
+    assert json.loads(result) == {"ok": True}
+    retried: Any = session.post.call_args_list[1].kwargs
+    assert 'Content-Encoding' not in retried['headers']
+    assert json.loads(retried['data']) == large
+    mock_sleep.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_post_with_retry_keeps_gzip_after_validation_error() -> None:
+    """Test that a 400 on a gzipped body is raised, not resent or blamed on gzip"""
+    session: MagicMock = make_session(make_response(400))
+    large: Dict[str, str] = {"text": "x" * (_base.GZIP_MIN_BYTES * 2)}
+    with pytest.raises(aiohttp.ClientResponseError) as excinfo:
+        await post_with_retry(session, 'https://validates.test', {}, large, compress=True)
+
+    assert excinfo.value.status == 400
+    assert session.post.call_count == 1
+    assert 'validates.test' not in _base._gzip_rejected
+
+def test_ring_buffer_handler_defers_writes() -> None:
+    """Test that records are only formatted and written when drained"""
+    stream: io.StringIO = io.StringIO()
+    target: logging.StreamHandler[io.StringIO] = logging.StreamHandler(stream)
+    target.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+    handler: RingBufferHandler = RingBufferHandler(target, capacity=2, interval=3600)
+    test_logger: logging.Logger = logging.getLogger('test_ring_buffer')
+    test_logger.propagate = False
+    test_logger.addHandler(handler)
+    try:
+        for i in range(3):
+            test_logger.warning("record %d", i)
+        assert stream.getvalue() == ""
+
+        handler.flush()
+        # The oldest record fell out of the bounded buffer
+        assert stream.getvalue() == "WARNING record 1\nWARNING record 2\n"
+    finally:
+        test_logger.removeHandler(handler)
+        handler.close()
+
+def test_lazy_rotating_file_handler_creates_file_on_first_record(tmp_path: Any) -> None:
+    """Test that the log directory and file only appear once a record is written"""
+    log_path: str = os.path.join(str(tmp_path), 'logs', 'test_pipe.log')
+    handler: LazyRotatingFileHandler = LazyRotatingFileHandler(log_path, maxBytes=1000, backupCount=1)
+    try:
+        assert not os.path.exists(os.path.dirname(log_path))
+
+        handler.handle(logging.makeLogRecord({'msg': 'first record'}))
+        handler.flush()
+    finally:
+        handler.close()
+
+    with open(log_path) as f:
+        assert f.read() == "first record\n"
+
+@pytest.mark.asyncio
+async def test_http2_session_maps_httpx_responses_and_errors() -> None:
+    """Test that Http2Session behaves like the aiohttp session post_with_retry expects"""
+    httpx: Any = pytest.importorskip('httpx')
+    pytest.importorskip('h2')
+    from _http2 import Http2Session
+    calls: list[int] = []
+
+    def respond(request: Any) -> Any:
+        calls.append(1)
+        if len(calls) == 1:
+            raise httpx.RemoteProtocolError("connection reset", request=request)
+        assert request.headers['content-type'] == 'application/json'
+        return httpx.Response(200, content=b'{"ok": true}')
+
+    session: Http2Session = Http2Session(transport=httpx.MockTransport(respond))
+    try:
+        with patch('_base.asyncio.sleep', new=AsyncMock()):
+            body: bytes = await post_with_retry(session, 'https://api.example.com/v1', {}, {"a": 1})
+    finally:
+        await session.close()
+
+    assert body == b'{"ok": true}'
+    assert len(calls) == 2
+    assert session.closed
+
+@pytest.mark.asyncio
+async def test_undecodable_body_is_reported_per_item(tmp_path: Any) -> None:
+    """Test that a non-UTF-8 body becomes an error string and a bad cache entry a miss"""
+    spec: ProviderSpec = ProviderSpec(
+        name='binary',
+        display_name='Binary',
+        url='https://binary.test',
+        api_key_env='BINARY_API_KEY',
+        headers_fn=lambda key: {},
+        payload_fn=lambda text: {"text": text},
+        api_key='test_key'
+    )
+    cache: ResponseCache = ResponseCache('binary', directory=str(tmp_path))
+    cache.put("first", b'\xff\xfe')
+
+    async def send(text: str, session: Any) -> str:
+        return await _base.send_to_provider(spec, text, session, cache)
+
+    with patch('_base.post_with_retry', new=AsyncMock(return_value=b'\xff\xfe')) as mock_post:
+        results: list[str] = await send_many(send, ["first", "second"], MagicMock())
+
+    assert all(result.startswith("Unexpected error: ") for result in results)
+    assert mock_post.await_count == 2
@@ -0,0 +1,178 @@
+import pytest
+import sys
+import io
+import os
+from unittest.mock import patch, AsyncMock, MagicMock
+import aiohttp
+import json
+import asyncio
+import dataclasses
+from typing import Any
+
+# Add scripts directory to path for imports
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, SCRIPT_DIR)
+
+# Import the functions to test
+from gptzero_pipe import send_to_gptzero
+from _base import HTTPSession, ResponseCache, run_pipe
+from providers import GPTZERO
+import _base
+
+# GPTZERO as it is when GPTZERO_API_KEY is set
+KEYED_GPTZERO: Any = dataclasses.replace(GPTZERO, api_key='test_key')
+
+def make_session(mock_response: Any) -> MagicMock:
+    """Build a mock ClientSession whose post() yields mock_response"""
+    session: MagicMock = MagicMock()
+    session.post.return_value.__aenter__.return_value = mock_response
+    return session
+
+@pytest.mark.asyncio
+async def test_send_to_gptzero_uses_injected_session() -> None:
+    """Test that an injected session is used for the API call"""
+    mock_response: AsyncMock = AsyncMock()
+    mock_response.status = 200
+    mock_response.headers = {}
+    mock_response.read.return_value = b'{"documents": []}'
+    mock_response.raise_for_status = MagicMock()
+    session: MagicMock = make_session(mock_response)
+
+    with patch('gptzero_pipe.GPTZERO', dataclasses.replace(GPTZERO, api_key='test_key')):
+        result: str = await send_to_gptzero("Test input", session)
+
+    assert json.loads(result) == {"documents": []}
+    session.post.assert_called_once()
+    args: Any = session.post.call_args
+    assert args.args[0] == 'https://api.gptzero.me/v2/predict/text'
+    assert args.kwargs['headers']['x-api-key'] == 'test_key'
+
+@pytest.mark.asyncio
+async def test_get_session_is_reused() -> None:
+    """Test that the shared session is created once per event loop"""
+    try:
+        first: HTTPSession = _base.get_session()
+        second: HTTPSession = _base.get_session()
+        assert first is second
+    finally:
+        await _base.close_session()
+    assert first.closed
+
+@pytest.mark.asyncio
+async def test_close_session_closes_resolver() -> None:
+    """Test that the aiodns resolver, which the connector does not own, is closed too"""
+    resolver: MagicMock = MagicMock()
+    resolver.close = AsyncMock()
+    with patch('_base.HAS_AIODNS', True), \
+         patch('_base.aiohttp.AsyncResolver', return_value=resolver):
+        _base.get_session(http2=False)
+        await _base.close_session()
+
+    resolver.close.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_send_to_gptzero_serves_cached_response(tmp_path: Any) -> None:
+    """Test that a cached document is answered without calling the API"""
+    cache: ResponseCache = ResponseCache('gptzero', directory=str(tmp_path))
+    cache.put("Test input", b'{"documents": ["cached"]}')
+    session: MagicMock = MagicMock()
+
+    with patch('gptzero_pipe.GPTZERO', dataclasses.replace(GPTZERO, api_key='test_key')):
+        result: str = await send_to_gptzero("Test input", session, cache)
+
+    assert json.loads(result) == {"documents": ["cached"]}
+    session.post.assert_not_called()
+
+def test_run_pipe_stdin_input(monkeypatch: Any, capsys: Any) -> None:
+    """Test the pipe entrypoint reading stdin and printing the result"""
+    monkeypatch.setattr('sys.stdin', io.StringIO("Sample text for testing"))
+
+    with patch('_base.warmup', new=AsyncMock()), \
+         patch('_base.send_to_provider', new=AsyncMock(return_value='{"documents":[]}')) as mock_send:
+        asyncio.run(run_pipe(KEYED_GPTZERO, ['--pretty', '--cache', 'off']))
+
+    assert mock_send.await_args is not None
+    assert mock_send.await_args.args[:2] == (KEYED_GPTZERO, "Sample text for testing")
+    captured: Any = capsys.readouterr()
+    assert captured.out == '{\n  "documents": []\n}\n'
+
+def test_run_pipe_empty_input(monkeypatch: Any, capsys: Any) -> None:
+    """Test the pipe entrypoint with empty input"""
+    monkeypatch.setattr('sys.stdin', io.StringIO(""))
+
+    with patch('_base.warmup', new=AsyncMock()), \
+         pytest.raises(SystemExit) as excinfo:
+        asyncio.run(run_pipe(KEYED_GPTZERO, []))
+
+    assert excinfo.value.code == 1
+    assert "No input received" in capsys.readouterr().err
+
+def test_gptzero_headers_are_precomputed() -> None:
+    """Test that the API key is read once and headers are built once"""
+    with patch.dict(os.environ, {'GPTZERO_API_KEY': 'test_key'}):
+        spec: Any = dataclasses.replace(GPTZERO, api_key=None)
+
+    assert spec.api_key == 'test_key'
+    assert spec.headers is spec.headers
+    assert spec.headers['x-api-key'] == 'test_key'
+
+def test_run_pipe_jsonl(monkeypatch: Any, capsys: Any) -> None:
+    """Test that --jsonl sends each line and prints one result per line"""
+    monkeypatch.setattr('sys.stdin', io.StringIO('"first"\n\n{"text": "second"}\n42\n'))
+
+    async def fake_send(spec: Any, text: str, session: Any, cache: Any) -> str:
+        return '{\n"echo": "%s"\n}' % text if text == "first" else "API request failed: boom"
+
+    with patch('_base.warmup', new=AsyncMock()), \
+         patch('_base.send_to_provider', new=fake_send):
+        asyncio.run(run_pipe(KEYED_GPTZERO, ['--jsonl', '--cache', 'off']))
+
+    lines: list[Any] = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert lines[0] == {"echo": "first"}
+    assert lines[1] == {"error": "Invalid JSON Lines document: blank line"}
+    assert lines[2] == {"error": "API request failed: boom"}
+    assert "Invalid JSON Lines document" in lines[3]["error"]
+    assert len(lines) == 4
+
+def test_run_pipe_http2_without_httpx(monkeypatch: Any, capsys: Any) -> None:
+    """Test that --http2 is rejected with a usage error when httpx is missing"""
+    monkeypatch.setattr('sys.stdin', io.StringIO("Sample text for testing"))
+
+    with patch('_base.HAS_HTTPX', False), \
+         pytest.raises(SystemExit) as excinfo:
+        asyncio.run(run_pipe(GPTZERO, ['--http2']))
+
+    assert excinfo.value.code == 2
+    assert "--http2 needs httpx" in capsys.readouterr().err
+
+def test_provider_spec_repr_hides_api_key() -> None:
+    """Test that the API key never shows up in reprs, e.g. in assertion diffs"""
+    spec: Any = dataclasses.replace(GPTZERO, api_key='sekrit')
+    assert 'sekrit' not in repr(spec)
+
+def test_run_pipe_rejects_jsonl_with_pretty(monkeypatch: Any, capsys: Any) -> None:
+    """Test that --pretty is refused in --jsonl mode, where it would break the format"""
+    monkeypatch.setattr('sys.stdin', io.StringIO('"first"\n'))
+
+    with pytest.raises(SystemExit) as excinfo:
+        asyncio.run(run_pipe(GPTZERO, ['--jsonl', '--pretty']))
+
+    assert excinfo.value.code == 2
+    assert "--pretty cannot be combined with --jsonl" in capsys.readouterr().err
+
+def test_run_pipe_missing_api_key(monkeypatch: Any, capsys: Any) -> None:
+    """Test that a missing API key fails on stderr before warming up or reading stdin"""
+    stdin: MagicMock = MagicMock()
+    monkeypatch.setattr('sys.stdin', stdin)
+
+    with patch('_base.warmup', new=AsyncMock()) as mock_warmup, \
+         pytest.raises(SystemExit) as excinfo:
+        asyncio.run(run_pipe(dataclasses.replace(GPTZERO, api_key=''), []))
+
+    assert excinfo.value.code == 1
+    captured: Any = capsys.readouterr()
+    assert captured.err == "GPTZERO_API_KEY environment variable not set\n"
+    assert captured.out == ""
+    mock_warmup.assert_not_called()
+    stdin.read.assert_not_called()